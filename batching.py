@@ -0,0 +1,166 @@
+# batching.py
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+import psutil
+import torch
+
+from config import Config
+from utils import logger
+
+# 推理时每帧在内存中的额外开销（letterbox、归一化等中间拷贝），按原始帧大小的倍数估计
+_RAM_FRAME_FACTOR = 3
+# 显存中每帧的估计开销：640x640 fp32 输入张量的倍数（包含中间特征图）
+_VRAM_FRAME_BYTES = 640 * 640 * 3 * 4 * 20
+
+
+class FrameBatchBuffer:
+    """
+    预分配的帧批次缓冲区。
+    视频帧通过 cap.retrieve 依次解码写入缓冲区槽位，满批推理后 clear 从头复用同一块内存，避免逐帧分配整帧数组。
+    """
+
+    def __init__(self, capacity: int, height: int, width: int):
+        self.capacity = capacity
+        self.data = np.empty((capacity, height, width, 3), dtype=np.uint8)
+        self.times: List[float] = []
+
+    @property
+    def size(self) -> int:
+        return len(self.times)
+
+    def matches(self, capacity: int, height: int, width: int) -> bool:
+        return self.capacity == capacity and self.data.shape[1:3] == (height, width)
+
+    def is_full(self) -> bool:
+        return self.size >= self.capacity
+
+    def retrieve(self, cap: cv2.VideoCapture, frame_time: float) -> bool:
+        """将 cap 最近一次 grab 的帧解码到下一个空槽位"""
+        slot = self.data[self.size]
+        ret, frame = cap.retrieve(slot)
+        if not ret:
+            return False
+        if not np.may_share_memory(frame, slot):
+            # 个别帧分辨率与容器头不一致时 OpenCV 会另行分配，拷贝/缩放回槽位
+            if frame.shape != slot.shape:
+                cv2.resize(frame, (slot.shape[1], slot.shape[0]), dst=slot)
+            else:
+                np.copyto(slot, frame)
+        self.times.append(frame_time)
+        return True
+
+    def frames(self) -> List[np.ndarray]:
+        """当前批次各帧的视图（不拷贝），在 clear 后会被覆盖"""
+        return list(self.data[:self.size])
+
+    def clear(self) -> None:
+        self.times = []
+
+
+class AutoBatchSizer:
+    """
+    --batch_size auto：按可用内存/显存与帧分辨率确定候选批大小上限，
+    启动时对若干候选值做推理基准测试，选吞吐最高者，并按 模型+设备+分辨率 缓存到磁盘。
+    """
+
+    def __init__(self, cfg: Config, device: str, infer: Callable[[List[np.ndarray]], list]):
+        self.cfg = cfg
+        self.device = device
+        self.infer = infer
+        self.cache_path = Path(cfg.batch_size_cache_path)
+        self._cache = self._load_cache()
+        # 本次运行内已确定的批大小，避免逐视频重算内存上限导致批大小抖动、缓冲区反复重建
+        self._resolved: Dict[str, int] = {}
+
+    def _load_cache(self) -> Dict[str, int]:
+        if not self.cache_path.exists():
+            return {}
+        try:
+            return json.loads(self.cache_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            logger.warning("读取批大小缓存失败，将重新测试：%s", e)
+            return {}
+
+    def _save_cache(self) -> None:
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.cache_path.write_text(json.dumps(self._cache, indent=2), encoding='utf-8')
+        except OSError as e:
+            logger.warning("写入批大小缓存失败：%s", e)
+
+    def _cache_key(self, width: int, height: int) -> str:
+        return f"{Path(self.cfg.model_path).name}|{self.device}|{width}x{height}"
+
+    def get(self, width: int, height: int) -> int:
+        key = self._cache_key(width, height)
+        if key in self._resolved:
+            return self._resolved[key]
+        if key in self._cache:
+            # 缓存值可能测于空闲时，按当前可用内存/显存再收紧（每次运行每种分辨率只检查一次）
+            batch_size = min(int(self._cache[key]), self._memory_limit(width, height))
+        else:
+            batch_size = self._benchmark(width, height)
+            self._cache[key] = batch_size
+            self._save_cache()
+        self._resolved[key] = batch_size
+        return batch_size
+
+    def _memory_limit(self, width: int, height: int) -> int:
+        """可用内存（及显存）允许的最大批大小"""
+        fraction = self.cfg.auto_batch_memory_fraction
+        ram_per_frame = width * height * 3 * _RAM_FRAME_FACTOR
+        limit = int(psutil.virtual_memory().available * fraction // ram_per_frame)
+        if self.device.startswith("cuda"):
+            free_vram, _ = torch.cuda.mem_get_info()
+            limit = min(limit, int(free_vram * fraction // _VRAM_FRAME_BYTES))
+        return max(1, min(limit, self.cfg.auto_batch_max_size))
+
+    def _candidates(self, limit: int) -> List[int]:
+        sizes = []
+        n = 1
+        while n <= limit:
+            sizes.append(n)
+            n *= 2
+        return sizes
+
+    def _throughput(self, frames: List[np.ndarray]) -> float:
+        """返回每秒处理帧数，首轮作为预热不计时"""
+        self.infer(frames)
+        rounds = self.cfg.auto_batch_bench_rounds
+        start = time.perf_counter()
+        for _ in range(rounds):
+            self.infer(frames)
+        if self.device.startswith("cuda"):
+            torch.cuda.synchronize()
+        return len(frames) * rounds / (time.perf_counter() - start)
+
+    def _benchmark(self, width: int, height: int) -> int:
+        limit = self._memory_limit(width, height)
+        logger.info("自动批大小：基准测试 %dx%d，上限 %d ...", width, height, limit)
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        best_size, best_fps = 1, 0.0
+        for size in self._candidates(limit):
+            try:
+                fps = self._throughput([frame] * size)
+            except (torch.cuda.OutOfMemoryError, MemoryError, RuntimeError) as e:
+                # CUDA/cuDNN 分配失败常以普通 RuntimeError 抛出，其余 RuntimeError 照常上抛
+                if (isinstance(e, RuntimeError) and not isinstance(e, torch.cuda.OutOfMemoryError)
+                        and "out of memory" not in str(e).lower()):
+                    raise
+                logger.info("自动批大小：batch=%d 内存不足，停止测试", size)
+                if self.device.startswith("cuda"):
+                    torch.cuda.empty_cache()
+                break
+            logger.info("自动批大小：batch=%d %.1f frame/s", size, fps)
+            if fps > best_fps:
+                best_size, best_fps = size, fps
+            elif fps < best_fps * 0.95:
+                # 吞吐已明显下降，更大的批次不再有收益
+                break
+        logger.info("自动批大小：%dx%d 选用 batch_size=%d", width, height, best_size)
+        return best_size
@@ -17,6 +17,11 @@ class Config:
     save_detect_frame: bool = False  # 保存检测首尾帧，观察检测结果
     detect_step: float = 0.25  # 检测步长：每隔一定时长检测一帧，单位s
     batch_size: int = 1
+    auto_batch_size: bool = False  # 启动时基准测试，按内存/显存与分辨率自动选择 batch_size
+    auto_batch_max_size: int = 128  # 自动批大小的上限
+    auto_batch_memory_fraction: float = 0.5  # 批次最多占用可用内存/显存的比例
+    auto_batch_bench_rounds: int = 2  # 每个候选批大小的计时轮数
+    batch_size_cache_path: Path = Path.home() / ".catclipper" / "batch_size_cache.json"  # 按模型+分辨率缓存
 
     # 时间戳与临时/最终文件
     timestamp_csv_name: str = "cat_timestamps.csv"  # CSV: video,start_sec,end_sec
@@ -29,6 +34,16 @@ class Config:
     start_expand_seconds: float = 2.0
     end_expand_seconds: float = 2.0
 
+    # 视频元数据缓存（ffprobe）与 dry run 估算
+    video_meta_cache_path: Path = Path.home() / ".catclipper" / "video_meta_cache.json"  # 按 size+mtime 失效
+    probe_workers: int = 8  # 并行 ffprobe 进程数
+    keyframe_probe_seconds: float = 30.0  # 统计关键帧间隔时读取的视频开头时长
+    dry_run_decode_mpix_per_sec: float = 250.0  # 估算用：解码吞吐，百万像素/秒
+    dry_run_infer_fps_cpu: float = 10.0  # 估算用：CPU 推理帧/秒
+    dry_run_infer_fps_gpu: float = 200.0  # 估算用：GPU 推理帧/秒
+    dry_run_cat_ratio: float = 0.1  # 估算用：含猫片段占总素材的比例
+    dry_run_copy_mb_per_sec: float = 200.0  # 估算用：ffmpeg -c copy 读写吞吐，MB/秒
+
     # 临时目录（在 output_dir 下）
     tmp_dir_name: str = "tmp_catclipper"
 
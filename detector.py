@@ -10,8 +10,10 @@ from typing import List, Tuple, Iterator
 from ultralytics.engine.results import Results
 
 import utils
+from batching import AutoBatchSizer, FrameBatchBuffer
 from config import Config
-from utils import append_csv, format_seconds, logger
+from probe import MetadataCache, list_input_videos, probe_video_cached, video_name
+from utils import append_csv, format_seconds, logger, read_processed_log
 from tqdm import tqdm
 import math
 
@@ -22,13 +24,31 @@ class Detector:
         self.device = "cuda:0" if utils.support_cuda() else "cpu"
         self.model = YOLO(cfg.model_path).to(self.device)
         logger.info(f"YOLO模型位于设备: {self.model.device}")
+        self.batch_sizer = AutoBatchSizer(cfg, self.device, self._infer) if cfg.auto_batch_size else None
+        self._frame_buffer = None
+        self.meta_cache = MetadataCache(cfg.video_meta_cache_path)
 
     def _iter_video_files(self) -> List[Path]:
-        p = Path(self.cfg.input_dir)
-        if not p.exists():
-            raise FileNotFoundError(f"input_dir not found: {p}")
-        files = sorted([f for f in p.iterdir() if f.suffix.lower() in self.cfg.video_extensions])
-        return files
+        return list_input_videos(self.cfg)
+
+    def _get_frame_buffer(self, width: int, height: int) -> FrameBatchBuffer:
+        """按分辨率确定批大小并返回预分配缓冲区，分辨率与批大小不变时跨视频复用"""
+        batch_size = self.batch_sizer.get(width, height) if self.batch_sizer else self.cfg.batch_size
+        if self._frame_buffer is None or not self._frame_buffer.matches(batch_size, height, width):
+            self._frame_buffer = FrameBatchBuffer(batch_size, height, width)
+        self._frame_buffer.clear()
+        return self._frame_buffer
+
+    def _prepare_batch_size(self, video_path: Path) -> None:
+        """auto 模式下，在检测开始前按首个待处理视频的分辨率完成基准测试；其余分辨率在首次遇到时测试"""
+        cap = cv2.VideoCapture(str(video_path))
+        try:
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+        finally:
+            cap.release()
+        if width > 0 and height > 0:
+            self.batch_sizer.get(width, height)
 
     def detect_all(self) -> None:
         """
@@ -45,32 +65,39 @@ class Detector:
             return
 
         # 已处理集合
-        processed = set()
-        if processed_log.exists():
-            processed = set([l.strip() for l in processed_log.read_text(encoding='utf-8').splitlines() if l.strip()])
+        processed = read_processed_log(processed_log)
 
         found_frame_num = 0
 
         video_files = self._iter_video_files()
-        with tqdm(total=len(video_files), desc="扫描视频文件", unit="file") as pbar:
-            for video_path in video_files:
-                if video_path.name in processed:
-                    logger.info("跳过已处理：%s", video_path.name)
+        if self.batch_sizer:
+            pending = [f for f in video_files if video_name(self.cfg, f) not in processed]
+            if pending:
+                self._prepare_batch_size(pending[0])
+        try:
+            with tqdm(total=len(video_files), desc="扫描视频文件", unit="file") as pbar:
+                for video_path in video_files:
+                    name = video_name(self.cfg, video_path)
+                    if name in processed:
+                        logger.info("跳过已处理：%s", name)
+                        pbar.update(1)  # 手动更新进度条
+                        continue
+
+                    frame_times = self.detect_video(video_path)
+                    rows = [[name, format_seconds(t)] for t in frame_times]
+                    if rows:
+                        append_csv(timestamps_path, rows, ['video_name', 'frame_time'])
+                    # 追加 processed_log
+                    processed_log.parent.mkdir(parents=True, exist_ok=True)
+                    with processed_log.open("a", encoding='utf-8') as f:
+                        f.write(name + "\n")
+                        f.flush()
+
+                    found_frame_num += len(frame_times)
                     pbar.update(1)  # 手动更新进度条
-                    continue
-
-                frame_times = self.detect_video(video_path)
-                rows = [[video_path.name, format_seconds(t)] for t in frame_times]
-                if rows:
-                    append_csv(timestamps_path, rows, ['video_name', 'frame_time'])
-                # 追加 processed_log
-                processed_log.parent.mkdir(parents=True, exist_ok=True)
-                with processed_log.open("a", encoding='utf-8') as f:
-                    f.write(video_path.name + "\n")
-                    f.flush()
-
-                found_frame_num += len(frame_times)
-                pbar.update(1)  # 手动更新进度条
+        finally:
+            # 按需补充的元数据统一在此写回，避免每个视频整体读写一次缓存文件
+            self.meta_cache.save()
         # 检测完成，创建.ok文件
         detect_ok.touch()
 
@@ -91,52 +118,68 @@ class Detector:
             return []
 
         fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+        if fps <= 0 or total_frames <= 0 or width <= 0 or height <= 0:
+            # 容器头缺少信息时，才用 ffprobe 元数据（带缓存）补充
+            meta = probe_video_cached(video_path, self.cfg, self.meta_cache)
+            if meta:
+                fps = fps if fps > 0 else meta.fps
+                total_frames = total_frames if total_frames > 0 else meta.frame_count
+                if width <= 0 or height <= 0:
+                    width, height = meta.width, meta.height
         if fps <= 0:
-            logger.error("无法获取视频帧率：%s", video_path)
-            raise Exception("无法获取视频帧率")
+            # 采样按帧时间戳进行，帧率仅用于提示
+            logger.warning("无法获取视频帧率：%s", video_path)
         # skip_frame_num = int(self.cfg.detect_step * fps)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
         if total_frames <= 0:
-            logger.error("无法获取视频总帧数：%s", video_path)
-            raise Exception("无法获取视频总帧数")
+            logger.warning("无法获取视频总帧数，进度条将不显示总量：%s", video_path)
+        if width <= 0 or height <= 0:
+            logger.warning("无法获取视频分辨率，将按首个解码帧确定：%s", video_path)
         # duration = total_frames / fps
         frame_cnt = 1
         last_collect_data_time = -self.cfg.detect_step - 1
 
         detected_frame_times = []
-        batch_data = []
-        batch_time = []
+        buffer = self._get_frame_buffer(width, height) if width > 0 and height > 0 else None
 
         pbar = tqdm(total=total_frames if total_frames > 0 else None,
                     desc=f"检测 {video_path.name}", unit="frame", leave=False)
         try:
             while True:
-                ret, frame = cap.read()
-                if not ret:
+                # grab 只解码不转换，仅采样帧才 retrieve 到缓冲区
+                if not cap.grab():
                     break
 
                 current_time = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
 
                 if current_time - last_collect_data_time > self.cfg.detect_step:
                     last_collect_data_time = current_time
-                    batch_data.append(frame)
-                    batch_time.append(current_time)
-                    if len(batch_data) == self.cfg.batch_size:
+                    if buffer is None:
+                        # 分辨率未知时，以首个采样帧的尺寸建立缓冲区，该帧随后再 retrieve 入槽位
+                        ret, frame = cap.retrieve()
+                        if not ret:
+                            break
+                        buffer = self._get_frame_buffer(frame.shape[1], frame.shape[0])
+                    if not buffer.retrieve(cap, current_time):
+                        break
+                    if buffer.is_full():
                         detected_frame_times.extend(
-                            self.detect_batch_data(batch_data, batch_time, video_path)
+                            self.detect_batch_data(buffer.frames(), buffer.times, video_path)
                         )
-                        batch_data = []
-                        batch_time = []
+                        buffer.clear()
 
                 # 其余帧纯跳过
                 frame_cnt += 1
                 pbar.update(1)
 
             # 循环结束后，处理残余 batch
-            if len(batch_data) > 0:
+            if buffer is not None and buffer.size > 0:
                 detected_frame_times.extend(
-                    self.detect_batch_data(batch_data, batch_time, video_path)
+                    self.detect_batch_data(buffer.frames(), buffer.times, video_path)
                 )
+                buffer.clear()
 
         finally:
             pbar.close()
@@ -145,22 +188,24 @@ class Detector:
         return detected_frame_times
 
 
-    def detect_batch_data(self, data, data_times, video_path:Path) -> List[float]:
+    def _infer(self, data) -> List[Results]:
         # 模型推理
-        detected_frame_times = []
         if utils.support_cuda():
-            results = self.model(data,
-                                 conf=self.cfg.confidence_threshold,
-                                 classes=self.cfg.cat_class_id,
-                                 verbose=False,
-                                 half=utils.support_fp16(),
-                                 device=self.device)
-        else:
-            results = self.model(data,
-                                 conf=self.cfg.confidence_threshold,
-                                 classes=self.cfg.cat_class_id,
-                                 verbose=False,
-                                 device=self.device)
+            return self.model(data,
+                              conf=self.cfg.confidence_threshold,
+                              classes=self.cfg.cat_class_id,
+                              verbose=False,
+                              half=utils.support_fp16(),
+                              device=self.device)
+        return self.model(data,
+                          conf=self.cfg.confidence_threshold,
+                          classes=self.cfg.cat_class_id,
+                          verbose=False,
+                          device=self.device)
+
+    def detect_batch_data(self, data, data_times, video_path:Path) -> List[float]:
+        detected_frame_times = []
+        results = self._infer(data)
 
         for res_time, res in zip(data_times, results):
             if len(res.boxes) > 0:
@@ -170,7 +215,8 @@ class Detector:
                     self.cfg.output_dir,
                     self.cfg.tmp_dir_name,
                     'frags',
-                    f"{video_path.name}-{res_time}.jpg"
+                    # 不同日期目录下常有同名视频，用相对路径区分
+                    f"{video_name(self.cfg, video_path).replace('/', '_')}-{res_time}.jpg"
                 )
                 res.save(str(save_path))
 
@@ -3,6 +3,7 @@ import argparse
 from pathlib import Path
 import logging
 
+from planner import dry_run
 from postprocess import postprocess
 import utils
 from config import Config
@@ -23,6 +24,18 @@ utils_logger.setLevel(logging.INFO)
 utils_logger.addHandler(ch)
 
 
+def batch_size_arg(value: str):
+    if value.lower() == "auto":
+        return "auto"
+    try:
+        size = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"batch_size 须为正整数或 auto：{value}")
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"batch_size 须为正整数或 auto：{value}")
+    return size
+
+
 def parse_args():
     p = argparse.ArgumentParser(description="Cat clipper: 用YOLO检测并拼接包含猫的视频片段")
     p.add_argument("--input_dir", type=str, help="监控视频目录")
@@ -32,8 +45,10 @@ def parse_args():
     p.add_argument('--save_detect_frame', action="store_true", help="保存每个片段的开始帧，观察检测结果，默认关闭")
     p.add_argument("--force", action="store_true", help="检测阶段会记录进度以断点继续，可force强制重新检测")
     p.add_argument("--no_clean", action="store_true", help="拼接后不删除临时片段")
-    p.add_argument("--batch_size", type=int, help="检测阶段处理视频的批次帧大小，默认1，有GPU可尝试扩大")
+    p.add_argument("--batch_size", type=batch_size_arg,
+                   help="检测阶段处理视频的批次帧大小，默认1，有GPU可尝试扩大；auto 为按内存与分辨率自动测试选择")
     p.add_argument("--step", type=float, help="片段前后扩展时间，默认0.5秒")
+    p.add_argument("--dry_run", action="store_true", help="仅读取视频元数据，统计采样帧数并估算检测与裁剪耗时，不执行检测")
     return p.parse_args()
 
 
@@ -52,13 +67,19 @@ def main():
         cfg.delete_temp_files = False
     if args.save_detect_frame:
         cfg.save_detect_frame = True
-    if args.batch_size:
+    if args.batch_size == "auto":
+        cfg.auto_batch_size = True
+    elif args.batch_size:
         cfg.batch_size = args.batch_size
     if args.step:
         cfg.detect_step = args.step
 
     logger.info("配置：input=%s output=%s model=%s", cfg.input_dir, cfg.output_dir, cfg.model_path)
 
+    if args.dry_run:
+        dry_run(cfg, force=args.force)
+        return
+
     # 检查 ffmpeg
     ffmpeg = find_ffmpeg()
     if not ffmpeg:
@@ -0,0 +1,77 @@
+# planner.py
+import math
+from pathlib import Path
+
+import utils
+from config import Config
+from probe import VideoMeta, list_input_videos, probe_videos, video_name
+from utils import logger, read_processed_log
+
+
+def format_duration(sec: float) -> str:
+    """秒数格式化为 1h02m03s 形式，便于阅读估算结果"""
+    sec = int(round(sec))
+    h, rest = divmod(sec, 3600)
+    m, s = divmod(rest, 60)
+    if h:
+        return f"{h}h{m:02d}m{s:02d}s"
+    if m:
+        return f"{m}m{s:02d}s"
+    return f"{s}s"
+
+
+def sampled_frame_count(meta: VideoMeta, detect_step: float) -> int:
+    """与 Detector.detect_video 一致：帧时间距上次采样超过 step 才采样，即每 floor(step*fps)+1 帧取一帧"""
+    if meta.fps <= 0:
+        return math.ceil(meta.duration / detect_step) if detect_step > 0 else 0
+    interval = math.floor(detect_step * meta.fps) + 1
+    return math.ceil(meta.frame_count / interval)
+
+
+def dry_run(cfg: Config, force: bool = False) -> None:
+    """
+    不加载模型、不检测：用（缓存的）ffprobe 元数据统计待处理视频的采样帧数，并粗略估算检测与裁剪耗时。
+    吞吐按 Config 中 dry_run_* 参数估算，可根据本机实测调整。
+    """
+    video_files = list_input_videos(cfg)
+    processed = set()
+    if not force:
+        processed_log = Path(cfg.output_dir) / cfg.tmp_dir_name / cfg.processed_log_name
+        processed = read_processed_log(processed_log)
+    pending = [f for f in video_files if video_name(cfg, f) not in processed]
+    metas = probe_videos(pending, cfg)
+
+    total_duration = 0.0
+    total_frames = 0
+    total_pixels = 0
+    sampled_frames = 0
+    total_bytes = 0
+    keyframe_intervals = []
+    for meta in metas.values():
+        total_duration += meta.duration
+        total_frames += meta.frame_count
+        total_pixels += meta.frame_count * meta.width * meta.height
+        sampled_frames += sampled_frame_count(meta, cfg.detect_step)
+        total_bytes += meta.size
+        if meta.keyframe_interval:
+            keyframe_intervals.append(meta.keyframe_interval)
+
+    # 检测：所有帧都要解码（grab），仅采样帧推理
+    infer_fps = cfg.dry_run_infer_fps_gpu if utils.support_cuda() else cfg.dry_run_infer_fps_cpu
+    decode_sec = total_pixels / (cfg.dry_run_decode_mpix_per_sec * 1e6)
+    infer_sec = sampled_frames / infer_fps
+    # 裁剪：-c copy 为纯读写，裁剪、拼接、remux 各约读写一遍含猫部分
+    clip_sec = total_bytes * cfg.dry_run_cat_ratio * 3 / (cfg.dry_run_copy_mb_per_sec * 1024 * 1024)
+
+    logger.info("dry run：视频 %d 个，已处理跳过 %d 个，待检测 %d 个（缺少元数据 %d 个）",
+                len(video_files), len(video_files) - len(pending), len(pending), len(pending) - len(metas))
+    logger.info("dry run：总时长 %s，总帧数 %d，按 step=%.2fs 采样检测 %d 帧",
+                format_duration(total_duration), total_frames, cfg.detect_step, sampled_frames)
+    logger.info("dry run：预计检测耗时 %s（解码 %s + 推理 %s，%s %.1f frame/s）",
+                format_duration(decode_sec + infer_sec), format_duration(decode_sec), format_duration(infer_sec),
+                "GPU" if utils.support_cuda() else "CPU", infer_fps)
+    logger.info("dry run：预计裁剪拼接耗时 %s（假设含猫占比 %.0f%%，素材 %.1f GB）",
+                format_duration(clip_sec), cfg.dry_run_cat_ratio * 100, total_bytes / 1024 ** 3)
+    if keyframe_intervals:
+        logger.info("dry run：平均关键帧间隔 %.2fs，-c copy 裁剪的起点会对齐到关键帧",
+                    sum(keyframe_intervals) / len(keyframe_intervals))
@@ -0,0 +1,266 @@
+# probe.py
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from fractions import Fraction
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from tqdm import tqdm
+
+from config import Config
+from utils import find_ffprobe, logger, run_cmd
+
+
+@dataclass
+class VideoMeta:
+    size: int
+    mtime: float
+    duration: float  # 秒
+    fps: float
+    codec: str
+    width: int
+    height: int
+    keyframe_interval: Optional[float] = None  # 平均关键帧间隔，秒
+
+    @property
+    def frame_count(self) -> int:
+        return int(round(self.duration * self.fps))
+
+
+def scan_video_files(root: Path, extensions: Iterable[str], exclude_dirs: Iterable[Path] = ()) -> List[Path]:
+    """
+    递归遍历 root 下的视频文件。
+    使用 os.scandir 直接读取目录项类型，无需逐个 stat，适合数万文件的嵌套日期目录。
+    跟随目录符号链接（如从 NAS 链接进来的日期目录），按 (st_dev, st_ino) 去重以防链接成环。
+    """
+    exts = {e.lower() for e in extensions}
+    excluded = {os.path.normcase(os.path.abspath(d)) for d in exclude_dirs}
+    files = []
+    visited = set()
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            # 每个目录 stat 一次；Windows 上 DirEntry.stat 不提供 st_ino，故用 os.stat
+            st = os.stat(current)
+        except OSError as e:
+            logger.warning("无法读取目录，跳过：%s (%s)", current, e)
+            continue
+        dir_id = (st.st_dev, st.st_ino)
+        if dir_id in visited:
+            logger.warning("目录已扫描过（符号链接重复或成环），跳过：%s", current)
+            continue
+        visited.add(dir_id)
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        if os.path.normcase(os.path.abspath(entry.path)) not in excluded:
+                            stack.append(entry.path)
+                    elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in exts:
+                        files.append(Path(entry.path))
+        except OSError as e:
+            logger.warning("无法读取目录，跳过：%s (%s)", current, e)
+    return sorted(files)
+
+
+def list_input_videos(cfg: Config) -> List[Path]:
+    """input_dir 下（含子目录）的全部视频，排除位于其中的输出目录（含临时目录与最终视频）"""
+    p = Path(cfg.input_dir)
+    if not p.exists():
+        raise FileNotFoundError(f"input_dir not found: {p}")
+    # output_dir 与 input_dir 相同时只排除临时目录；根目录本身不会被排除
+    output_dir = Path(cfg.output_dir)
+    return scan_video_files(p, cfg.video_extensions, [output_dir, output_dir / cfg.tmp_dir_name])
+
+
+def video_name(cfg: Config, video_path: Path) -> str:
+    """视频相对 input_dir 的路径，用作进度记录与 CSV 中的视频名；平铺目录下即文件名"""
+    return video_path.relative_to(cfg.input_dir).as_posix()
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    """解析 ffprobe 的帧率字符串，如 30000/1001，无效时返回 0"""
+    try:
+        return float(Fraction(rate))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def probe_video(ffprobe: str, path: Path, stat: os.stat_result, keyframe_probe_seconds: float) -> Optional[VideoMeta]:
+    """
+    调用一次 ffprobe 读取视频流信息、容器时长，以及开头一段的包关键帧标记。
+    """
+    cmd = [
+        ffprobe,
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries",
+        "stream=codec_name,width,height,avg_frame_rate,r_frame_rate,duration,nb_frames"
+        ":format=duration:packet=pts_time,flags",
+        "-read_intervals", f"%+{keyframe_probe_seconds}",
+        "-of", "json",
+        str(path),
+    ]
+    ret, out, err = run_cmd(cmd)
+    if ret != 0:
+        logger.warning("ffprobe 失败：%s (ret=%s err=%s)", path, ret, err.strip())
+        return None
+    try:
+        info = json.loads(out)
+    except ValueError:
+        logger.warning("ffprobe 输出无法解析：%s", path)
+        return None
+
+    streams = info.get("streams") or []
+    if not streams:
+        logger.warning("未找到视频流：%s", path)
+        return None
+    stream = streams[0]
+
+    fps = _parse_rate(stream.get("avg_frame_rate")) or _parse_rate(stream.get("r_frame_rate"))
+    duration = _to_float(info.get("format", {}).get("duration")) or _to_float(stream.get("duration"))
+    if duration <= 0 and fps > 0:
+        duration = _to_float(stream.get("nb_frames")) / fps
+
+    key_times = [
+        _to_float(p.get("pts_time")) for p in info.get("packets") or []
+        if "K" in p.get("flags", "") and p.get("pts_time") is not None
+    ]
+    keyframe_interval = None
+    if len(key_times) >= 2:
+        keyframe_interval = (max(key_times) - min(key_times)) / (len(key_times) - 1)
+
+    return VideoMeta(
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        duration=duration,
+        fps=fps,
+        codec=stream.get("codec_name", ""),
+        width=int(stream.get("width") or 0),
+        height=int(stream.get("height") or 0),
+        keyframe_interval=keyframe_interval,
+    )
+
+
+class MetadataCache:
+    """
+    视频元数据的 JSON 缓存，以绝对路径为键；文件 size 或 mtime 变化即视为失效。
+    整个文件在构造时读入一次，put 只改内存，save 时整体写回。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._entries: Dict[str, dict] = {}
+        self._dirty = False
+        if self.path.exists():
+            try:
+                self._entries = json.loads(self.path.read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                logger.warning("读取元数据缓存失败，将重新扫描：%s", e)
+
+    @staticmethod
+    def _key(video_path: Path) -> str:
+        return os.path.abspath(video_path)
+
+    def get(self, video_path: Path, stat: os.stat_result) -> Optional[VideoMeta]:
+        entry = self._entries.get(self._key(video_path))
+        if not entry or entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime:
+            return None
+        try:
+            return VideoMeta(**entry)
+        except TypeError:
+            return None
+
+    def put(self, video_path: Path, meta: VideoMeta) -> None:
+        self._entries[self._key(video_path)] = asdict(meta)
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(self._entries), encoding='utf-8')
+            tmp_path.replace(self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.warning("写入元数据缓存失败：%s", e)
+
+
+def probe_videos(video_files: List[Path], cfg: Config) -> Dict[Path, VideoMeta]:
+    """
+    返回各视频的元数据：命中缓存的直接使用，其余用 ffprobe 并行读取后写回缓存。
+    ffprobe 不可用或读取失败的视频不会出现在结果中。
+    """
+    cache = MetadataCache(cfg.video_meta_cache_path)
+    metas = {}
+    pending = []
+    for video_path in video_files:
+        try:
+            stat = video_path.stat()
+        except OSError as e:
+            logger.warning("无法读取文件信息，跳过：%s (%s)", video_path, e)
+            continue
+        meta = cache.get(video_path, stat)
+        if meta:
+            metas[video_path] = meta
+        else:
+            pending.append((video_path, stat))
+
+    if not pending:
+        return metas
+    ffprobe = find_ffprobe()
+    if not ffprobe:
+        logger.warning("未找到 ffprobe，%d 个视频缺少元数据", len(pending))
+        return metas
+
+    pool = ThreadPoolExecutor(max_workers=cfg.probe_workers)
+    futures = [
+        pool.submit(probe_video, ffprobe, video_path, stat, cfg.keyframe_probe_seconds)
+        for video_path, stat in pending
+    ]
+    try:
+        for (video_path, _), future in tqdm(zip(pending, futures), total=len(pending),
+                                            desc="读取视频元数据", unit="file"):
+            meta = future.result()
+            if meta:
+                cache.put(video_path, meta)
+                metas[video_path] = meta
+    finally:
+        # 中断时取消排队中的 ffprobe，只等待正在运行的，并保留已扫描部分
+        pool.shutdown(wait=True, cancel_futures=True)
+        cache.save()
+    return metas
+
+
+def probe_video_cached(video_path: Path, cfg: Config, cache: MetadataCache) -> Optional[VideoMeta]:
+    """
+    单个视频的元数据：先查缓存，未命中再调用 ffprobe 并放入缓存（由调用方 save）。
+    供检测阶段在容器头缺少信息时按需补充，ffprobe 不可用时返回 None。
+    """
+    try:
+        stat = video_path.stat()
+    except OSError as e:
+        logger.warning("无法读取文件信息：%s (%s)", video_path, e)
+        return None
+    meta = cache.get(video_path, stat)
+    if meta:
+        return meta
+    ffprobe = find_ffprobe()
+    if not ffprobe:
+        return None
+    meta = probe_video(ffprobe, video_path, stat, cfg.keyframe_probe_seconds)
+    if meta:
+        cache.put(video_path, meta)
+    return meta
@@ -1,7 +1,7 @@
 # utils.py
 import subprocess
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Set
 import csv
 import logging
 import shutil
@@ -41,6 +41,19 @@ def find_ffmpeg() -> Optional[str]:
     return ffmpeg_path
 
 
+def find_ffprobe() -> Optional[str]:
+    """
+    Check ffprobe existence via shutil.which.
+    Returns path or None.
+    """
+    ffprobe_path = shutil.which("ffprobe")
+    if ffprobe_path:
+        logger.debug("ffprobe found at: %s", ffprobe_path)
+    else:
+        logger.error("ffprobe not found in PATH")
+    return ffprobe_path
+
+
 def format_seconds(sec: float) -> str:
     """Return string format suitable for ffmpeg (seconds with 2 decimal)"""
     return f"{sec:.2f}"
@@ -120,6 +133,13 @@ def read_fragment_csv(input_csv: Path) -> List[Tuple[str, float, float]]:
     return fragments
 
 
+def read_processed_log(path: Path) -> Set[str]:
+    """读取检测阶段已处理的视频名集合"""
+    if not path.exists():
+        return set()
+    return set([l.strip() for l in path.read_text(encoding='utf-8').splitlines() if l.strip()])
+
+
 def remove_tree(path: Path):
     if path.exists():
         if path.is_dir():